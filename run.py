@@ -21,19 +21,45 @@ Auth modes:
 
 import argparse
 import csv
+import gzip
 import hashlib
 import os
 import re
 import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
+from functools import lru_cache
 import requests
+from requests.adapters import HTTPAdapter
 from urllib.parse import urlparse
 from playwright.sync_api import sync_playwright
 
+try:
+    import orjson
+    _json_dumps = orjson.dumps
+    _json_loads = orjson.loads
+except ImportError:  # orjson is optional; stdlib json is a few times slower
+    import json
+
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj).encode()
+
+    _json_loads = json.loads
+
 API_BASE = None  # Set in main()
+_SESSION = requests.Session()  # Keep-alive connection pool to the model server, mounted in main()
 MODEL_NAME = None  # Auto-detected from server
+MODEL_ROOT = None  # Served model's path or hub id, from /models; used to find its tokenizer
 MAX_STEPS = 50
 MAX_CONTEXT_CHARS = 80000  # ~20K tokens; keeps prompt under 32K context with room for completion
+MAX_CONTEXT_TOKENS = 20000  # Same budget when a tokenizer is available to count exactly
 MAX_TREE_LINES = 600  # Cap the accessibility tree to prevent huge pages from blowing context
+OBSERVATION_MODE = "axtree"  # Set in main(); "domsnapshot" builds the tree from DOMSnapshot
+COMPRESS_REQUESTS = False  # Set in main(); gzip request bodies for remote model servers
 
 SYSTEM_PROMPT = r"""You are a browser interaction assistant designed to execute step-by-step browser operations efficiently and precisely to complete the user's task. You are provided with specific tasks and webpage-related information, and you need to output accurate actions to accomplish the user's task.
 
@@ -93,164 +119,578 @@ HISTORY_info: {history_info}
 """
 
 
-# Global mapping from tree observation ID -> backendDOMNodeId, rebuilt each step
-obs_node_map = {}
+# Per-page accessibility tree cache: page -> {"key": ..., "tree": str, "nodes": list}
+_ax_cache = {}
+
+# One CDP session per page, attached lazily and reused for every command
+_cdp_sessions = weakref.WeakKeyDictionary()
+
+# Counts DOM mutations in window.__ax_mut so the tree cache can tell whether
+# the page changed since the last snapshot. Installed as an init script for
+# future documents and also evaluated when reading the cache key, which
+# installs it on documents that started loading before the init script was
+# registered. Evaluates to the count, or -1 if the count can't be trusted:
+# the observer was just installed (earlier changes went unseen), or the page
+# uses shadow DOM, whose mutations the observer on document never sees.
+_MUTATION_COUNTER_JS = """(() => {
+    if (!window.__ax_mut_observer) {
+        window.__ax_mut = 0;
+        window.__ax_mut_observer = new MutationObserver(() => {
+            window.__ax_mut += 1;
+        });
+        window.__ax_mut_observer.observe(document, {
+            childList: true, subtree: true, attributes: true, characterData: true,
+        });
+        const attachShadow = Element.prototype.attachShadow;
+        Element.prototype.attachShadow = function(init) {
+            window.__ax_shadow = true;
+            return attachShadow.call(this, init);
+        };
+        return -1;
+    }
+    if (!window.__ax_shadow) {
+        // Roots attached before the hook (or declaratively by the parser)
+        window.__ax_shadow = Array.prototype.some.call(
+            document.querySelectorAll("*"), el => el.shadowRoot);
+    }
+    return window.__ax_shadow ? -1 : window.__ax_mut;
+})()"""
 
 
 # ---------------------------------------------------------------------------
 # Accessibility tree
 # ---------------------------------------------------------------------------
 
-def get_accessibility_tree(page) -> str:
-    """Get a simplified accessibility tree from the page via CDP.
-
-    Also populates obs_node_map so we can resolve tree IDs to DOM elements later.
+# Roles that are never shown; their children are walked at the same depth
+_SKIP_ROLES = frozenset({
+    "none", "generic", "Ignored", "ignored",
+    "InlineTextBox", "StaticText",
+})
+# Structural roles that are only shown when they carry a name
+_EMPTY_SKIP_ROLES = frozenset({
+    "img", "list", "strong", "paragraph",
+    "banner", "navigation", "Section", "LabelText", "Legend", "listitem",
+})
+_SHOWN_PROPERTIES = frozenset({
+    "level", "setsize", "posinset", "disabled",
+    "focused", "required", "checked", "selected",
+})
+# Depth never exceeds the number of emitted lines
+_INDENTS = ["\t" * depth for depth in range(MAX_TREE_LINES + 1)]
+
+# DOMSnapshot observation mode: implicit ARIA roles by tag / input type
+_IMPLICIT_ROLES = {
+    "A": "link", "BUTTON": "button", "SELECT": "combobox", "TEXTAREA": "textbox",
+    "H1": "heading", "H2": "heading", "H3": "heading",
+    "H4": "heading", "H5": "heading", "H6": "heading",
+    "IMG": "img", "TABLE": "table", "TR": "row", "TH": "columnheader", "TD": "cell",
+    "UL": "list", "OL": "list", "LI": "listitem", "OPTION": "option",
+    "NAV": "navigation", "MAIN": "main", "HEADER": "banner", "FOOTER": "contentinfo",
+    "ASIDE": "complementary", "ARTICLE": "article", "FORM": "form",
+    "DIALOG": "dialog", "P": "paragraph", "LABEL": "LabelText", "SUMMARY": "button",
+}
+_INPUT_ROLES = {
+    "button": "button", "submit": "button", "reset": "button", "image": "button",
+    "checkbox": "checkbox", "radio": "radio", "range": "slider",
+    "search": "searchbox", "number": "spinbutton", "hidden": "",
+}
+_NAME_FROM_CONTENT_ROLES = frozenset({
+    "button", "cell", "checkbox", "columnheader", "heading", "link", "menuitem",
+    "option", "radio", "row", "rowheader", "switch", "tab", "treeitem",
+})
+_HEADING_LEVELS = {f"H{level}": level for level in range(1, 7)}
+_MAX_NAME_CHARS = 100
+_MAX_SHOWN_NAME_CHARS = 200  # Longer accessible names are cut in the observation
+
+
+def _cdp_session_for(page):
+    """Return the persistent CDP session for *page*, attaching it on first use.
+
+    The session is reused for every CDP command on the page and dropped when
+    the page closes. It also listens for main-frame navigations (bumping
+    ``page._ax_nav_id``) and registers the MutationObserver counter as an init
+    script; together with the URL they form the accessibility tree cache key.
     """
-    global obs_node_map
-    obs_node_map = {}
+    cdp = _cdp_sessions.get(page)
+    if cdp is not None:
+        return cdp
 
     cdp = page.context.new_cdp_session(page)
+    page._ax_nav_id = 0
+
+    def on_frame_navigated(event):
+        if not event.get("frame", {}).get("parentId"):
+            page._ax_nav_id += 1
+
+    def on_close(_page):
+        _cdp_sessions.pop(page, None)
+        _ax_cache.pop(page, None)
+
+    cdp.on("Page.frameNavigated", on_frame_navigated)
+    # Only Page events are needed; getFullAXTree, captureSnapshot and
+    # getContentQuads work without enabling their domains, which would keep
+    # accessibility mode on and stream node updates for the whole run.
+    cdp.send("Page.enable")
+    page.on("close", on_close)
+    page.add_init_script(_MUTATION_COUNTER_JS)
+    _cdp_sessions[page] = cdp
+    return cdp
+
+
+def _ax_cache_key(page):
+    """Return the cache key for the page's current state, or None if unknown."""
     try:
-        result = cdp.send("Accessibility.getFullAXTree")
-        nodes = result.get("nodes", [])
-    finally:
-        cdp.detach()
+        mutations = page.evaluate(_MUTATION_COUNTER_JS)
+    except Exception:
+        return None  # Page mid-navigation
+    if mutations < 0:
+        return None
+    return (page.main_frame.url, page._ax_nav_id, mutations)
 
-    if not nodes:
+
+def invalidate_ax_cache(page):
+    """Drop the cached accessibility tree for *page*."""
+    _ax_cache.pop(page, None)
+
+
+@dataclass(slots=True)
+class ObsNode:
+    """DOM node behind one tree ID, as needed to act on it."""
+
+    backend_id: int
+    role: str
+    name: str
+
+
+def get_accessibility_tree(page) -> str:
+    """Get a simplified accessibility tree from the page via CDP.
+
+    Also populates ``page._obs_nodes`` — a list indexed by tree ID holding the
+    ObsNode (or None) — so we can resolve tree IDs to DOM elements later.
+    The result is cached per page and reused while the URL, navigation count
+    and DOM mutation count are unchanged.
+    """
+    cdp = _cdp_session_for(page)
+    key = _ax_cache_key(page)
+    cached = _ax_cache.get(page)
+    if key is not None and cached and cached["key"] == key:
+        page._obs_nodes = cached["nodes"]
+        print(f"  [Tree: cached, {_count_interactive(page._obs_nodes)} interactive elements]")
+        return cached["tree"]
+
+    obs_nodes = page._obs_nodes = []
+    lines = None
+    if OBSERVATION_MODE == "domsnapshot":
+        lines = _dom_snapshot_lines(cdp, obs_nodes)
+    if lines is None:
+        lines = _ax_tree_lines(cdp, obs_nodes)
+    if lines is None:
         return "(empty page)"
+    print(f"  [Tree: {len(lines)} lines, {_count_interactive(obs_nodes)} interactive elements]")
+
+    tree = "\n".join(lines)
+    if key is not None:
+        _ax_cache[page] = {"key": key, "tree": tree, "nodes": obs_nodes}
+    return tree
+
+
+def _count_interactive(obs_nodes) -> int:
+    return sum(1 for info in obs_nodes if info is not None)
+
+
+def _obs_node(page, node_id: int) -> ObsNode | None:
+    """Return the DOM node for a tree ID from the last observation."""
+    obs_nodes = getattr(page, "_obs_nodes", ())
+    return obs_nodes[node_id] if 0 <= node_id < len(obs_nodes) else None
+
+
+def _ax_tree_lines(cdp, obs_nodes) -> list[str] | None:
+    """Format Accessibility.getFullAXTree as observation lines.
+
+    Returns None for an empty tree.
+    """
+    result = cdp.send("Accessibility.getFullAXTree")
+    nodes = result.get("nodes", [])
 
-    # Deduplicate nodes by nodeId
-    seen = set()
-    unique_nodes = []
-    for n in nodes:
-        if n["nodeId"] not in seen:
-            unique_nodes.append(n)
-            seen.add(n["nodeId"])
-    nodes = unique_nodes
+    if not nodes:
+        return None
 
+    # Index by nodeId; this also deduplicates repeated nodes
     node_map = {n["nodeId"]: n for n in nodes}
     lines = []
-    counter = [0]
-    _walk_cdp_tree(nodes[0], node_map, lines, depth=0, counter=counter)
-    if len(lines) > MAX_TREE_LINES:
-        truncated = len(lines) - MAX_TREE_LINES
-        lines = lines[:MAX_TREE_LINES]
-        lines.append(f"... ({truncated} more elements truncated)")
-    print(f"  [Tree: {len(lines)} lines, {len(obs_node_map)} interactive elements]")
-    return "\n".join(lines)
-
-
-def _walk_cdp_tree(node, node_map, lines, depth, counter):
-    """Recursively walk the CDP accessibility tree and format it with IDs."""
-    role = _get_ax_value(node, "role")
-    name = _get_ax_value(node, "name")
-
-    # Determine if this is a valid node worth showing.
-    # InlineTextBox and StaticText are never interactive — they just duplicate
-    # parent content and confuse the model into targeting non-interactive IDs.
-    skip_roles = {
-        "none", "generic", "Ignored", "ignored",
-        "InlineTextBox", "StaticText",
-    }
-    valid = role not in skip_roles or False  # skip_roles are always skipped
+    if _walk_cdp_tree(node_map[nodes[0]["nodeId"]], node_map, lines, obs_nodes):
+        lines.append("... (more elements truncated)")
+    return lines
+
+
+def _walk_cdp_tree(root, node_map, lines, obs_nodes) -> bool:
+    """Walk the CDP accessibility tree depth-first and format it with IDs.
+
+    Iterative to avoid per-node call overhead. Stops once MAX_TREE_LINES lines
+    have been emitted; returns True if nodes were left unvisited. *obs_nodes*
+    gets one entry per emitted line (None for nodes without a DOM node).
+    """
+    append = lines.append
+    get_node = node_map.get
+    stack = [(root, 0)]
+    obs_id = 0
+
+    while stack:
+        if obs_id >= MAX_TREE_LINES:
+            return True
+        node, depth = stack.pop()
+        get = node.get
+        role = (get("role") or {}).get("value", "")
+        name = (get("name") or {}).get("value", "")
+
+        # Determine if this is a valid node worth showing.
+        # InlineTextBox and StaticText are never interactive — they just
+        # duplicate parent content and confuse the model into targeting
+        # non-interactive IDs. Unnamed structural nodes are skipped too.
+        valid = role not in _SKIP_ROLES and not (
+            role in _EMPTY_SKIP_ROLES and not name.strip()
+        )
+
+        if valid:
+            shown = name
+            if len(shown) > _MAX_SHOWN_NAME_CHARS:
+                shown = shown[:_MAX_SHOWN_NAME_CHARS] + "…"
+            # Build the node string matching TIGER-AI-Lab format
+            node_str = f"{_INDENTS[depth]}[{obs_id}] {role} {shown!r}"
+
+            # Add properties (focused, required, etc.)
+            props = []
+            for prop in get("properties", ()):
+                pname = prop.get("name", "")
+                if pname in _SHOWN_PROPERTIES:
+                    pval = prop.get("value", {})
+                    val = pval.get("value", "") if isinstance(pval, dict) else pval
+                    props.append(f"{pname}: {val}")
+            if props:
+                node_str += " " + " ".join(props)
+            append(node_str)
+
+            # Store mapping for action execution
+            backend_id = get("backendDOMNodeId")
+            obs_nodes.append(ObsNode(backend_id, role, name) if backend_id is not None else None)
+            obs_id += 1
+            depth += 1
+
+        for child_id in reversed(get("childIds", ())):
+            child = get_node(child_id)
+            if child:
+                stack.append((child, depth))
+
+    return False
+
+
+def _dom_snapshot_lines(cdp, obs_nodes) -> list[str] | None:
+    """Format DOMSnapshot.captureSnapshot as observation lines.
+
+    The browser returns a compact columnar snapshot, so the Python side never
+    sees the InlineTextBox/StaticText/generic nodes the AX tree is full of.
+    Roles come from the ``role`` attribute or the tag's implicit ARIA role,
+    names from aria-label/alt/title/placeholder or the rendered text. Only
+    rendered nodes of the main document are shown, in the same
+    ``[id] role 'name'`` format as the AX tree. Returns None when the snapshot
+    is not populated so the caller can fall back to the AX tree.
+    """
+    try:
+        snapshot = cdp.send("DOMSnapshot.captureSnapshot", {
+            "computedStyles": [],
+            "includeDOMRects": False,
+            "includePaintOrder": False,
+        })
+    except Exception:
+        return None
+    documents = snapshot.get("documents") or []
+    if not documents or not documents[0]["nodes"].get("nodeName"):
+        return None
+
+    strings = snapshot["strings"]
+    doc = documents[0]
+    nodes = doc["nodes"]
+    parents = nodes["parentIndex"]
+    node_types = nodes["nodeType"]
+    node_names = nodes["nodeName"]
+    node_values = nodes["nodeValue"]
+    backend_ids = nodes["backendNodeId"]
+    attributes = nodes["attributes"]
+    checked = set(nodes.get("inputChecked", {}).get("index", ()))
+    selected = set(nodes.get("optionSelected", {}).get("index", ()))
+
+    # Only nodes with a layout object are rendered
+    rendered = set(doc.get("layout", {}).get("nodeIndex", ()))
+
+    children = [[] for _ in parents]
+    for index, parent in enumerate(parents):
+        if parent >= 0:
+            children[parent].append(index)
+
+    def text_of(index):
+        parts = []
+        length = 0
+        stack = [index]
+        while stack and length < _MAX_NAME_CHARS:
+            i = stack.pop()
+            if node_types[i] == 3:
+                if i in rendered and node_values[i] >= 0:
+                    text = strings[node_values[i]].strip()
+                    if text:
+                        parts.append(text)
+                        length += len(text) + 1
+            else:
+                stack.extend(reversed(children[i]))
+        return " ".join(" ".join(parts).split())[:_MAX_NAME_CHARS]
+
+    lines = []
+    stack = [(0, 0)]
+    obs_id = 0
+    while stack:
+        if obs_id >= MAX_TREE_LINES:
+            lines.append("... (more elements truncated)")
+            break
+        index, depth = stack.pop()
 
-    # For non-skipped roles, still skip empty generic-like structural nodes
-    if valid and not name.strip() and role in (
-        "img", "list", "strong", "paragraph",
-        "banner", "navigation", "Section", "LabelText", "Legend", "listitem",
-    ):
         valid = False
+        if node_types[index] == 1 and index in rendered:
+            attrs = attributes[index]
+            attrs = {strings[attrs[k]]: strings[attrs[k + 1]]
+                     for k in range(0, len(attrs), 2)}
+            tag = strings[node_names[index]]
+            role = attrs.get("role", "").split(" ")[0]
+            if role == "presentation":
+                role = "none"
+            elif not role:
+                if tag == "INPUT":
+                    role = _INPUT_ROLES.get(attrs.get("type", "text").lower(), "textbox")
+                elif tag != "A" or "href" in attrs:
+                    role = _IMPLICIT_ROLES.get(tag, "")
+
+            name = ""
+            if role:
+                name = (attrs.get("aria-label") or attrs.get("alt")
+                        or attrs.get("title") or attrs.get("placeholder") or "")
+                if not name and role in _NAME_FROM_CONTENT_ROLES:
+                    name = text_of(index)
+                name = name.strip()
+            valid = bool(role) and role not in _SKIP_ROLES and not (
+                role in _EMPTY_SKIP_ROLES and not name
+            )
 
-    if valid:
-        obs_id = counter[0]
-        counter[0] += 1
-        indent = "\t" * depth
-
-        # Build the node string matching TIGER-AI-Lab format
-        node_str = f"[{obs_id}] {role} {repr(name)}"
-
-        # Add properties (focused, required, etc.)
-        props = []
-        for prop in node.get("properties", []):
-            pname = prop.get("name", "")
-            if pname in ("level", "setsize", "posinset", "disabled",
-                         "focused", "required", "checked", "selected"):
-                pval = prop.get("value", {})
-                val = pval.get("value", "") if isinstance(pval, dict) else pval
-                props.append(f"{pname}: {val}")
-        if props:
-            node_str += " " + " ".join(props)
-
-        lines.append(f"{indent}{node_str}")
-
-        # Store mapping for action execution
-        if "backendDOMNodeId" in node:
-            obs_node_map[obs_id] = {
-                "backend_id": node["backendDOMNodeId"],
-                "role": role,
-                "name": name,
-            }
-
-    for child_id in node.get("childIds", []):
-        child = node_map.get(child_id)
-        if child:
-            child_depth = depth + 1 if valid else depth
-            _walk_cdp_tree(child, node_map, lines, child_depth, counter)
-
-
-def _get_ax_value(node, field):
-    """Extract a string value from an accessibility tree node field."""
-    obj = node.get(field, {})
-    if isinstance(obj, dict):
-        return obj.get("value", "")
-    return str(obj)
+        if valid:
+            node_str = f"{_INDENTS[depth]}[{obs_id}] {role} {name!r}"
+            props = []
+            if tag in _HEADING_LEVELS:
+                props.append(f"level: {_HEADING_LEVELS[tag]}")
+            if role in ("checkbox", "radio", "switch"):
+                props.append(f"checked: {'true' if index in checked else 'false'}")
+            if index in selected:
+                props.append("selected: True")
+            if "disabled" in attrs:
+                props.append("disabled: True")
+            if "required" in attrs:
+                props.append("required: True")
+            if props:
+                node_str += " " + " ".join(props)
+            lines.append(node_str)
+
+            obs_nodes.append(ObsNode(backend_ids[index], role, name))
+            obs_id += 1
+            depth += 1
+
+        for child in reversed(children[index]):
+            stack.append((child, depth))
+
+    return lines
 
 
 # ---------------------------------------------------------------------------
 # LLM communication
 # ---------------------------------------------------------------------------
 
+_FENCE = "```"
+
+
 def extract_command(text: str) -> str:
-    """Extract the last command from code fences in the model response."""
-    blocks = re.findall(r"```\s*([^\s].*?[^\s])\s*```", text, re.DOTALL)
-    if not blocks:
-        return ""
-    return blocks[-1].strip().replace("```", "").strip()
+    """Extract the last command from code fences in the model response.
+
+    Fences pair up from the start of the text, so an unclosed trailing fence
+    is ignored. Pairs are scanned backwards with rfind, skipping empty ones,
+    instead of regex-matching every block in the response.
+    """
+    end = text.rfind(_FENCE)
+    if text.count(_FENCE) % 2:
+        end = text.rfind(_FENCE, 0, end)
+    while end > 0:
+        start = text.rfind(_FENCE, 0, end)
+        if start == -1:
+            break
+        command = text[start + len(_FENCE):end].strip().strip("`").strip()
+        if command:
+            return command
+        end = text.rfind(_FENCE, 0, start)
+    return ""
 
 
 def extract_conclusion(text: str) -> str:
-    """Extract conclusion content from the model response."""
-    blocks = re.findall(r"<conclusion>\s*(.*?)\s*</conclusion>", text, re.DOTALL)
-    if not blocks:
+    """Extract the last conclusion from the model response."""
+    end = text.rfind("</conclusion>")
+    start = text.rfind("<conclusion>", 0, end) if end != -1 else -1
+    if start == -1:
         return ""
-    return blocks[-1].strip()
+    return text[start + len("<conclusion>"):end].strip()
+
+
+_JSON_HEADERS = {"Content-Type": "application/json"}
+_GZIP_JSON_HEADERS = {**_JSON_HEADERS, "Content-Encoding": "gzip"}
+_GZIP_MIN_BYTES = 1024
+_TEXT_COMPLETIONS = False  # Set once /chat/completions has returned 404
+# Prompt budgets are counted in tokens when a tokenizer is available, else
+# chars. All of these are set by _load_tokenizer() on the first prompt.
+_tokenizer_loaded = False
+_encode = _decode = None
+_BUDGET_UNIT = "chars"
+_CHARS_PER_UNIT = 1
+_CONTEXT_BUDGET = MAX_CONTEXT_CHARS
+
+
+def _load_tokenizer():
+    """Pick the prompt token counter, once, on the first prompt.
+
+    Prefers the served model's own tokenizer.json, read from MODEL_ROOT when
+    it is a local directory or from the Hugging Face cache vLLM filled, never
+    from the network. Falls back to tiktoken's cl100k as an approximation,
+    else ~4 chars/token.
+    """
+    global _tokenizer_loaded, _encode, _decode, _BUDGET_UNIT, _CHARS_PER_UNIT, _CONTEXT_BUDGET
+    _tokenizer_loaded = True
+    try:
+        from tokenizers import Tokenizer
+        if os.path.isdir(MODEL_ROOT):
+            path = os.path.join(MODEL_ROOT, "tokenizer.json")
+        else:
+            from huggingface_hub import hf_hub_download
+            path = hf_hub_download(MODEL_ROOT, "tokenizer.json", local_files_only=True)
+        tokenizer = Tokenizer.from_file(path)
+
+        def _encode(text: str) -> list[int]:
+            return tokenizer.encode(text, add_special_tokens=False).ids
+
+        _decode = tokenizer.decode
+    except Exception:
+        try:
+            import tiktoken
+            enc = tiktoken.get_encoding("cl100k_base")
 
+            def _encode(text: str) -> list[int]:
+                return enc.encode(text, disallowed_special=())
 
-def send_prompt(objective: str, observation: str, history_action: str, history_info: str) -> str:
+            _decode = enc.decode
+        except Exception:
+            return
+    _BUDGET_UNIT = "tokens"
+    _CHARS_PER_UNIT = 4
+    _CONTEXT_BUDGET = MAX_CONTEXT_TOKENS
+
+
+def _prompt_len(text: str) -> int:
+    """Length of *text* in budget units."""
+    if _encode is None:
+        return len(text)
+    return len(_encode(text))
+
+
+def _clip(text: str, limit: int, keep_tail: bool = False) -> tuple[str, bool]:
+    """Clip *text* to *limit* budget units, keeping the head (or the tail).
+
+    Returns the text and whether anything was cut.
+    """
+    units = text if _encode is None else _encode(text)
+    if len(units) <= limit:
+        return text, False
+    units = units[len(units) - limit:] if keep_tail else units[:limit]
+    return (units if _decode is None else _decode(units)), True
+
+
+# Appended to the system prompt with --script-action
+SCRIPT_ACTION_DOC = """Additional action:
+`script` followed by one action per line: Run several of the actions above in order without waiting for a new observation, e.g. to fill in a whole form. A script counts as one action. It ends after the first `click`, `press`, or `type` that presses Enter, since the page may change after those, so put such an action last:
+```script
+type [21] [Jane] [0]
+type [23] [Doe] [0]
+click [25] [Submit]```"""
+
+_PROMPT_PREFIX = SYSTEM_PROMPT + "\n\n"  # Set in main()
+
+
+@lru_cache(maxsize=4)
+def _budgets(objective_len: int) -> tuple[int, int]:
+    """Return (observation, history) budgets for an objective length.
+
+    System prompt + objective are fixed; the remaining space is split between
+    observation (70%) and history (30%). The objective is constant for a run,
+    so this is computed once rather than on every step.
+    """
+    fixed = _prompt_len(_PROMPT_PREFIX) + objective_len + 500 // _CHARS_PER_UNIT
+    budget = max(_CONTEXT_BUDGET - fixed, 4000 // _CHARS_PER_UNIT)
+    obs_budget = int(budget * 0.7)
+    return obs_budget, budget - obs_budget
+
+
+def _post_json(url: str, payload: dict):
+    """POST *payload* as JSON for a streamed response, gzipped if enabled.
+
+    Compression is opt-in: vLLM's own server does not decode compressed
+    request bodies, but a proxy in front of a remote one usually does.
+    """
+    body = _json_dumps(payload)
+    headers = _JSON_HEADERS
+    if COMPRESS_REQUESTS and len(body) > _GZIP_MIN_BYTES:
+        body = gzip.compress(body, compresslevel=1)
+        headers = _GZIP_JSON_HEADERS
+    return _SESSION.post(url, data=body, headers=headers, timeout=120, stream=True)
+
+
+def _post_chat(prompt: str):
+    return _post_json(f"{API_BASE}/chat/completions", {
+        "model": MODEL_NAME,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0,
+        "max_tokens": 1024,
+        "stream": True,
+    })
+
+
+def send_prompt(objective: str, observation: str, history_action: str, history_info: str,
+                hint: str = "") -> str:
     """Send the formatted prompt to the vLLM model and return the response.
 
     Tries /v1/chat/completions first (chat models). If the server returns 404,
-    falls back to /v1/completions (base/fine-tuned models).
+    the model name is re-detected in case the cached one is stale; if it was
+    not, falls back to /v1/completions (base/fine-tuned models).
+
+    The system prompt and objective lead the prompt unchanged on every step so
+    the server's prefix cache can reuse their KV; anything per-step — including
+    an optional *hint* such as the loop warning — comes after them.
     """
-    # Truncate to fit within model context window (~4 chars/token).
-    # Budget: system prompt + objective are fixed; split remaining space
-    # between observation (70%) and history (30%).
-    fixed = len(SYSTEM_PROMPT) + len(objective) + 500
-    budget = max(MAX_CONTEXT_CHARS - fixed, 4000)
-    obs_budget = int(budget * 0.7)
-    hist_budget = budget - obs_budget
+    global _TEXT_COMPLETIONS
+
+    if not _tokenizer_loaded:
+        _load_tokenizer()
 
-    if len(observation) > obs_budget:
-        observation = observation[:obs_budget] + "\n... (truncated)"
-        print(f"  [Truncated observation to ~{obs_budget} chars]")
-    combined_hist = len(history_action) + len(history_info)
-    if combined_hist > hist_budget:
+    # Truncate to fit within model context window (tokens, or ~4 chars/token).
+    obs_budget, hist_budget = _budgets(_prompt_len(objective))
+
+    observation, clipped = _clip(observation, obs_budget)
+    if clipped:
+        observation += "\n... (truncated)"
+        print(f"  [Truncated observation to ~{obs_budget} {_BUDGET_UNIT}]")
+    if _prompt_len(history_action) + _prompt_len(history_info) > hist_budget:
         half = hist_budget // 2
-        if len(history_action) > half:
-            history_action = history_action[-half:]
-        if len(history_info) > half:
-            history_info = history_info[-half:]
-        print(f"  [Truncated history to ~{hist_budget} chars]")
+        history_action, _ = _clip(history_action, half, keep_tail=True)
+        history_info, _ = _clip(history_info, half, keep_tail=True)
+        print(f"  [Truncated history to ~{hist_budget} {_BUDGET_UNIT}]")
 
     user_content = USER_PROMPT_TEMPLATE.format(
         objective=objective,
@@ -258,181 +698,372 @@ def send_prompt(objective: str, observation: str, history_action: str, history_i
         history_action=history_action,
         history_info=history_info,
     )
-    prompt = SYSTEM_PROMPT + "\n\n" + user_content
+    prompt = _PROMPT_PREFIX + user_content + hint
 
     # Try chat completions first, retry with halved prompt on 400 (context overflow)
     for attempt in range(3):
-        resp = requests.post(
-            f"{API_BASE}/chat/completions",
-            json={
+        if not _TEXT_COMPLETIONS:
+            resp = _post_chat(prompt)
+            if resp.status_code == 404 and _refresh_model_name():
+                # The cached model id was stale; retry with the served one
+                resp.close()
+                resp = _post_chat(prompt)
+            if resp.status_code == 404:
+                # No chat endpoint; use text completions from now on
+                resp.close()
+                _TEXT_COMPLETIONS = True
+
+        if _TEXT_COMPLETIONS:
+            resp = _post_json(f"{API_BASE}/completions", {
                 "model": MODEL_NAME,
-                "messages": [{"role": "user", "content": prompt}],
+                "prompt": prompt,
                 "temperature": 0,
                 "max_tokens": 1024,
-            },
-            timeout=120,
-        )
-
-        if resp.status_code == 404:
-            # Fall back to text completions endpoint
-            resp = requests.post(
-                f"{API_BASE}/completions",
-                json={
-                    "model": MODEL_NAME,
-                    "prompt": prompt,
-                    "temperature": 0,
-                    "max_tokens": 1024,
-                },
-                timeout=120,
-            )
+                "stream": True,
+            })
 
         if resp.status_code == 400 and attempt < 2:
             # Context overflow — aggressively truncate and retry
-            prompt = prompt[:len(prompt) // 2]
-            print(f"  [400 error — retrying with truncated prompt ({len(prompt)} chars)]")
+            resp.close()
+            prompt, _ = _clip(prompt, _prompt_len(prompt) // 2)
+            print(f"  [400 error — retrying with truncated prompt ({_prompt_len(prompt)} {_BUDGET_UNIT})]")
             continue
 
         break
 
     resp.raise_for_status()
-    data = resp.json()
+    return _read_stream(resp)
+
+
+def _read_stream(resp) -> str:
+    """Accumulate a streamed (SSE) completion from either endpoint.
+
+    Stops reading as soon as a complete fenced command follows ``</think>`` —
+    nothing after it is used — and closes the response, which makes the
+    server abort the rest of the generation.
+    """
+    resp.encoding = "utf-8"
+    parts = []
+    try:
+        for line in resp.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            payload = line[5:].strip()
+            if payload == "[DONE]":
+                break
+            choices = _json_loads(payload).get("choices") or [{}]
+            # Chat chunks carry delta.content, text completions carry text
+            chunk = (choices[0].get("delta") or {}).get("content") or choices[0].get("text") or ""
+            parts.append(chunk)
+            if "`" in chunk and _action_complete("".join(parts)):
+                break
+    finally:
+        resp.close()
+    return "".join(parts)
 
-    # Parse response from whichever endpoint worked
-    if "message" in data["choices"][0]:
-        return data["choices"][0]["message"]["content"]
-    return data["choices"][0]["text"]
+
+def _action_complete(text: str) -> bool:
+    """True once the text after the last ``</think>`` holds a closed code fence."""
+    end_think = text.rfind("</think>")
+    return end_think != -1 and text.count("```", end_think) >= 2
 
 
 # ---------------------------------------------------------------------------
 # Action execution
 # ---------------------------------------------------------------------------
 
-def execute_action(page, command: str, collected_data: list, seen_snapshots: set) -> bool:
-    """Parse and execute a BrowserAgent command. Returns False on stop."""
+# Splits a command once into its keyword and the argument text after it
+_CMD_RE = re.compile(r"(\w+)\s*(.*)", re.DOTALL)
+# Argument patterns, matched against the text after the keyword
+_ANSWER_ARG_RE = re.compile(r"\[(.+)\]", re.DOTALL)
+_TEXT_ARG_RE = re.compile(r"\[(.+)\]")
+_TYPE_ARGS_RE = re.compile(r"\[(\d+)\]\s+\[(.+?)\]\s*(?:\[(\d)\])?")
+
+
+def _id_arg(args: str) -> int | None:
+    """Parse a leading ``[123]`` argument by slicing, without a regex."""
+    end = args.find("]")
+    if end > 1 and args[0] == "[" and args[1:end].isdecimal():
+        return int(args[1:end])
+    return None
+
+
+def execute_action(page, command: str, collected_data: "CsvWriter",
+                   seen_snapshots: set[int]) -> tuple[bool, bool]:
+    """Parse and execute a BrowserAgent command.
+
+    Returns ``(keep_going, tree_dirty)``: keep_going is False on stop, and
+    tree_dirty is False when the action cannot have changed the page (stop,
+    extract, nothing executed), so the caller can reuse its observation.
+    """
     if not command:
         print("  No command extracted.")
-        return True
+        return True, False
 
     print(f"  Action: {command}")
 
-    if command.startswith("stop"):
-        answer = re.match(r"stop\s*\[(.+)\]", command, re.DOTALL)
-        if answer:
-            print(f"\n  Agent answer: {answer.group(1)}")
-        return False
+    match = _CMD_RE.match(command)
+    handler = _HANDLERS.get(match.group(1)) if match else None
+    if handler is None:
+        print(f"  Unknown command: {command}")
+        return True, False
+    return handler(page, match.group(2), collected_data, seen_snapshots)
 
-    if command.startswith("extract"):
-        match = re.match(r"extract\s+\[(.+)\]", command)
-        label = match.group(1).strip() if match else None
-        try_extract_data(page, collected_data, seen_snapshots, label=label)
-        return True
-
-    if command.startswith("click"):
-        match = re.match(r"click\s+\[(\d+)\]", command)
-        if match:
-            old_url = page.url
-            _click_by_tree_id(page, int(match.group(1)))
-            # Wait for potential navigation after click
-            try:
-                page.wait_for_load_state("domcontentloaded", timeout=5000)
-            except Exception:
-                pass
-            if page.url != old_url:
-                page.wait_for_timeout(1500)  # Extra settle time after navigation
-
-    elif command.startswith("type"):
-        match = re.match(r"type\s+\[(\d+)\]\s+\[(.+?)\]\s*(?:\[(\d)\])?", command)
-        if match:
-            node_id = int(match.group(1))
-            content = match.group(2)
-            press_enter = match.group(3) != "0" if match.group(3) else True
-            _type_by_tree_id(page, node_id, content, press_enter)
-
-    elif command.startswith("scroll"):
-        match = re.match(r"scroll\s+\[(down|up)\]", command)
-        direction = match.group(1) if match else "down"
-        delta = 500 if direction == "down" else -500
-        page.evaluate(f"window.scrollBy(0, {delta})")
-
-    elif command.startswith("goto"):
-        match = re.match(r"goto\s+\[(.+)\]", command)
-        if match:
-            page.goto(match.group(1), wait_until="domcontentloaded")
-
-    elif command.startswith("go_back"):
-        page.go_back(wait_until="domcontentloaded")
-
-    elif command.startswith("go_forward"):
-        page.go_forward(wait_until="domcontentloaded")
-
-    elif command.startswith("hover"):
-        match = re.match(r"hover\s+\[(\d+)\]", command)
-        if match:
-            _hover_by_tree_id(page, int(match.group(1)))
-
-    elif command.startswith("press"):
-        match = re.match(r"press\s+\[(.+)\]", command)
-        if match:
-            page.keyboard.press(match.group(1))
-
-    elif command.startswith("new_tab"):
-        page.context.new_page()
-
-    elif command.startswith("tab_focus"):
-        match = re.match(r"tab_focus\s+\[(\d+)\]", command)
-        if match:
-            idx = int(match.group(1))
-            pages = page.context.pages
-            if 0 <= idx < len(pages):
-                pages[idx].bring_to_front()
-
-    elif command.startswith("close_tab"):
-        page.close()
 
-    else:
-        print(f"  Unknown command: {command}")
+def _handle_stop(page, args, collected_data, seen_snapshots):
+    answer = _ANSWER_ARG_RE.match(args)
+    if answer:
+        print(f"\n  Agent answer: {answer.group(1)}")
+    return False, False
 
-    return True
+
+def _handle_extract(page, args, collected_data, seen_snapshots):
+    match = _TEXT_ARG_RE.match(args)
+    label = match.group(1).strip() if match else None
+    try_extract_data(page, collected_data, seen_snapshots, label=label)
+    return True, False
+
+
+def _handle_click(page, args, collected_data, seen_snapshots):
+    node_id = _id_arg(args)
+    if node_id is not None:
+        old_url = page.url
+        invalidate_ax_cache(page)
+        _click_by_tree_id(page, node_id)
+        # Wait for potential navigation after click
+        try:
+            page.wait_for_load_state("domcontentloaded", timeout=5000)
+        except Exception:
+            pass
+        if page.url != old_url:
+            _adaptive_wait(page)  # Extra settle time after navigation
+    return True, True
+
+
+def _handle_type(page, args, collected_data, seen_snapshots):
+    match = _TYPE_ARGS_RE.match(args)
+    if match:
+        node_id = int(match.group(1))
+        content = match.group(2)
+        press_enter = match.group(3) != "0" if match.group(3) else True
+        invalidate_ax_cache(page)
+        _type_by_tree_id(page, node_id, content, press_enter)
+    return True, True
+
+
+def _handle_scroll(page, args, collected_data, seen_snapshots):
+    delta = -500 if args.startswith("[up]") else 500
+    page.evaluate(f"window.scrollBy(0, {delta})")
+    return True, True
+
+
+def _handle_goto(page, args, collected_data, seen_snapshots):
+    match = _TEXT_ARG_RE.match(args)
+    if match:
+        invalidate_ax_cache(page)
+        page.goto(match.group(1), wait_until="domcontentloaded")
+    return True, True
+
+
+def _handle_go_back(page, args, collected_data, seen_snapshots):
+    invalidate_ax_cache(page)
+    page.go_back(wait_until="domcontentloaded")
+    return True, True
+
+
+def _handle_go_forward(page, args, collected_data, seen_snapshots):
+    invalidate_ax_cache(page)
+    page.go_forward(wait_until="domcontentloaded")
+    return True, True
+
+
+def _handle_hover(page, args, collected_data, seen_snapshots):
+    node_id = _id_arg(args)
+    if node_id is not None:
+        # CSS :hover menus change the tree without any DOM mutation
+        invalidate_ax_cache(page)
+        _hover_by_tree_id(page, node_id)
+    return True, True
+
+
+def _handle_press(page, args, collected_data, seen_snapshots):
+    match = _TEXT_ARG_RE.match(args)
+    if match:
+        invalidate_ax_cache(page)
+        page.keyboard.press(match.group(1))
+    return True, True
+
+
+def _may_navigate(name: str, args: str) -> bool:
+    """Whether a command can start a navigation that has not committed yet.
+
+    Mouse and keyboard input return before the navigation they trigger
+    commits, so ``page.url`` still shows the old page right afterwards.
+    """
+    if name == "type":
+        match = _TYPE_ARGS_RE.match(args)
+        return not match or match.group(3) != "0"
+    return name in ("click", "press")
+
+
+def _handle_script(page, args, collected_data, seen_snapshots):
+    """Run one command per line, stopping as soon as tree IDs may be stale."""
+    tree_dirty = False
+    lines = [line.strip() for line in args.splitlines() if line.strip()]
+    for i, line in enumerate(lines):
+        match = _CMD_RE.match(line)
+        if not match or match.group(1) == "script":
+            continue
+        name, cmd_args = match.group(1), match.group(2)
+        if name in _TREE_ID_COMMANDS:
+            node_id = _id_arg(cmd_args)
+            if node_id is None or _obs_node(page, node_id) is None:
+                print(f"  [Script stopped: no element for '{line}']")
+                break
+        old_url = page.url
+        keep_going, dirty = execute_action(page, line, collected_data, seen_snapshots)
+        tree_dirty = tree_dirty or dirty
+        if not keep_going:
+            return False, tree_dirty
+        if _may_navigate(name, cmd_args) or page.url != old_url:
+            if i + 1 < len(lines):
+                print("  [Script stopped: page may have changed, remaining IDs are stale]")
+            break
+    return True, tree_dirty
+
+
+def _handle_new_tab(page, args, collected_data, seen_snapshots):
+    page.context.new_page()
+    return True, True
+
+
+def _handle_tab_focus(page, args, collected_data, seen_snapshots):
+    idx = _id_arg(args)
+    if idx is not None:
+        pages = page.context.pages
+        if 0 <= idx < len(pages):
+            pages[idx].bring_to_front()
+    return True, True
+
+
+def _handle_close_tab(page, args, collected_data, seen_snapshots):
+    page.close()
+    return True, True
+
+
+# Command keyword -> handler(page, args, collected_data, seen_snapshots)
+# returning (keep_going, tree_dirty)
+_HANDLERS = {
+    "stop": _handle_stop,
+    "extract": _handle_extract,
+    "click": _handle_click,
+    "type": _handle_type,
+    "scroll": _handle_scroll,
+    "goto": _handle_goto,
+    "go_back": _handle_go_back,
+    "go_forward": _handle_go_forward,
+    "hover": _handle_hover,
+    "press": _handle_press,
+    "new_tab": _handle_new_tab,
+    "tab_focus": _handle_tab_focus,
+    "close_tab": _handle_close_tab,
+    "script": _handle_script,
+}
+# Commands whose first argument is a tree ID from the current observation
+_TREE_ID_COMMANDS = frozenset({"click", "type", "hover"})
 
 
 # ---------------------------------------------------------------------------
 # DOM interaction helpers
 # ---------------------------------------------------------------------------
 
+# True once the document has loaded and the mutation counter (window.__ax_mut)
+# has not moved for quietMs. State lives on window between polls; *token*
+# starts a fresh quiet period for each wait.
+_DOM_QUIET_JS = """([quietMs, token]) => {
+    const now = performance.now(), count = window.__ax_mut;
+    if (window.__settle_token !== token || window.__settle_count !== count) {
+        window.__settle_token = token;
+        window.__settle_count = count;
+        window.__settle_since = now;
+    }
+    return document.readyState === "complete" && now - window.__settle_since >= quietMs;
+}"""
+
+
+def _adaptive_wait(page, budget_ms: int = 1500, quiet_ms: int = 400):
+    """Wait for the page to settle, for at most *budget_ms*.
+
+    Load events fire once per document and then stay fired, so on their own
+    they return immediately after same-document updates (XHR clicks, SPA
+    routes). The wait therefore also needs the DOM to go *quiet_ms* without a
+    mutation, which is also the minimum settle time.
+    """
+    deadline = time.monotonic() + budget_ms / 1000
+    try:
+        page.wait_for_load_state("networkidle", timeout=budget_ms)
+        remaining_ms = max(int((deadline - time.monotonic()) * 1000), 1)
+        page.wait_for_function(_DOM_QUIET_JS, arg=[quiet_ms, time.monotonic_ns()],
+                               timeout=remaining_ms)
+    except Exception:
+        pass  # Budget exhausted or page navigated; carry on either way
+
+
+# Focuses a text field and sets its value through the native setter (so
+# framework-controlled inputs notice), firing input/change like real typing.
+_SET_VALUE_JS = """function(value) {
+    const tag = this.tagName;
+    if (tag !== "INPUT" && tag !== "TEXTAREA") return false;
+    if (tag === "INPUT" && !/^(text|search|email|url|tel|password|number)$/.test(this.type)) {
+        return false;
+    }
+    if (this.disabled || this.readOnly) return false;
+    this.focus();
+    const proto = tag === "INPUT" ? HTMLInputElement.prototype : HTMLTextAreaElement.prototype;
+    Object.getOwnPropertyDescriptor(proto, "value").set.call(this, value);
+    this.dispatchEvent(new Event("input", {bubbles: true}));
+    this.dispatchEvent(new Event("change", {bubbles: true}));
+    return true;
+}"""
+
+
 def _get_element_bounds(page, backend_node_id: int) -> dict | None:
-    """Get bounding rect for an element via CDP, same method as TIGER-AI-Lab."""
-    cdp = page.context.new_cdp_session(page)
+    """Get an element's viewport rect via CDP in a single round trip.
+
+    DOM.getContentQuads takes the backend node ID directly, so no remote
+    object has to be resolved first. The first quad (the first line box of a
+    wrapped inline element) is returned as an x/y/width/height rect.
+    """
+    cdp = _cdp_session_for(page)
     try:
-        remote = cdp.send("DOM.resolveNode", {"backendNodeId": backend_node_id})
-        object_id = remote["object"]["objectId"]
-        response = cdp.send("Runtime.callFunctionOn", {
-            "objectId": object_id,
-            "functionDeclaration": """function() {
-                if (this.nodeType == 3) {
-                    var range = document.createRange();
-                    range.selectNode(this);
-                    var rect = range.getBoundingClientRect().toJSON();
-                    range.detach();
-                    return rect;
-                } else {
-                    return this.getBoundingClientRect().toJSON();
-                }
-            }""",
-            "returnByValue": True,
-        })
-        return response.get("result", {}).get("value")
+        quads = cdp.send("DOM.getContentQuads", {"backendNodeId": backend_node_id})["quads"]
     except Exception:
+        return None  # Not rendered, or the node is gone
+    if not quads:
         return None
-    finally:
-        cdp.detach()
+    xs, ys = quads[0][0::2], quads[0][1::2]
+    left, top = min(xs), min(ys)
+    return {"x": left, "y": top, "width": max(xs) - left, "height": max(ys) - top}
+
+
+def _role_locator(page, info: ObsNode):
+    """Locate an element by role + name, preferring an exact name match.
+
+    A substring match is only used when nothing matches exactly, so "Sign in"
+    doesn't resolve to an earlier "Sign in with Google".
+    """
+    locator = page.get_by_role(info.role, name=info.name, exact=True)
+    if locator.count() == 0:
+        locator = page.get_by_role(info.role, name=info.name, exact=False)
+    return locator.first
 
 
 def _click_by_tree_id(page, node_id: int):
-    info = obs_node_map.get(node_id)
+    info = _obs_node(page, node_id)
     if not info:
         print(f"  Could not find element for tree ID {node_id}")
         return
-    bounds = _get_element_bounds(page, info["backend_id"])
+    bounds = _get_element_bounds(page, info.backend_id)
     if bounds and bounds.get("width", 0) > 0 and bounds.get("height", 0) > 0:
         x = bounds["x"] + bounds["width"] / 2
         y = bounds["y"] + bounds["height"] / 2
@@ -443,17 +1074,44 @@ def _click_by_tree_id(page, node_id: int):
     else:
         # Fallback: try role + name locator
         try:
-            page.get_by_role(info["role"], name=info["name"], exact=False).first.click()
+            _role_locator(page, info).click()
         except Exception as e:
             print(f"  Click failed on tree ID {node_id}: {e}")
 
 
+def _set_value_by_backend_id(page, backend_node_id: int, content: str) -> bool:
+    """Set a text field's value in one CDP call instead of per-key input events.
+
+    Returns False when the node is not an editable <input>/<textarea>, in which
+    case the caller falls back to keyboard typing.
+    """
+    cdp = _cdp_session_for(page)
+    try:
+        remote = cdp.send("DOM.resolveNode", {"backendNodeId": backend_node_id})
+        response = cdp.send("Runtime.callFunctionOn", {
+            "objectId": remote["object"]["objectId"],
+            "functionDeclaration": _SET_VALUE_JS,
+            "arguments": [{"value": content}],
+            "returnByValue": True,
+        })
+        return response.get("result", {}).get("value") is True
+    except Exception:
+        return False
+
+
 def _type_by_tree_id(page, node_id: int, content: str, press_enter: bool):
-    info = obs_node_map.get(node_id)
+    info = _obs_node(page, node_id)
     if not info:
         print(f"  Could not find element for tree ID {node_id}")
         return
-    bounds = _get_element_bounds(page, info["backend_id"])
+    if _set_value_by_backend_id(page, info.backend_id, content):
+        try:
+            if press_enter:
+                page.keyboard.press("Enter")
+        except Exception as e:
+            print(f"  Type failed on tree ID {node_id}: {e}")
+        return
+    bounds = _get_element_bounds(page, info.backend_id)
     if bounds and bounds.get("width", 0) > 0 and bounds.get("height", 0) > 0:
         x = bounds["x"] + bounds["width"] / 2
         y = bounds["y"] + bounds["height"] / 2
@@ -469,8 +1127,7 @@ def _type_by_tree_id(page, node_id: int, content: str, press_enter: bool):
     else:
         # Fallback: try role + name locator
         try:
-            locator = page.get_by_role(info["role"], name=info["name"], exact=False).first
-            locator.click()
+            _role_locator(page, info).click()
             page.keyboard.press("Control+a")
             page.keyboard.type(content)
             if press_enter:
@@ -480,11 +1137,11 @@ def _type_by_tree_id(page, node_id: int, content: str, press_enter: bool):
 
 
 def _hover_by_tree_id(page, node_id: int):
-    info = obs_node_map.get(node_id)
+    info = _obs_node(page, node_id)
     if not info:
         print(f"  Could not find element for tree ID {node_id}")
         return
-    bounds = _get_element_bounds(page, info["backend_id"])
+    bounds = _get_element_bounds(page, info.backend_id)
     if bounds and bounds.get("width", 0) > 0 and bounds.get("height", 0) > 0:
         x = bounds["x"] + bounds["width"] / 2
         y = bounds["y"] + bounds["height"] / 2
@@ -500,6 +1157,11 @@ def _hover_by_tree_id(page, node_id: int):
 # Generic page-aware data extraction
 # ---------------------------------------------------------------------------
 
+_TITLE_SPLIT_RE = re.compile(r"[\s|—\-:]+")
+_LABEL_UNSAFE_RE = re.compile(r"[^A-Za-z0-9\-]")
+_FILENAME_UNSAFE_RE = re.compile(r"[^A-Za-z0-9\-_]")
+
+
 def detect_page_context(page) -> dict:
     """Return a context dict with url, title, and a short label for tagging data."""
     url = page.url
@@ -513,7 +1175,7 @@ def detect_page_context(page) -> dict:
     path_slug = "-".join(path_parts[-2:]) if path_parts else parsed.hostname or "page"
 
     # Try to extract a short identifier from the title (first few words)
-    title_words = re.split(r"[\s|—\-:]+", title)
+    title_words = _TITLE_SPLIT_RE.split(title)
     title_slug = "-".join(title_words[:3]) if title_words else ""
 
     # Combine: prefer "domain-path" style, append title hint
@@ -528,75 +1190,115 @@ def detect_page_context(page) -> dict:
         label = domain_short or "page"
 
     # Sanitize: keep alphanumeric and hyphens, limit length
-    label = re.sub(r"[^A-Za-z0-9\-]", "", label)[:60]
+    label = _LABEL_UNSAFE_RE.sub("", label)[:60]
 
     return {"url": url, "title": title, "label": label}
 
 
-def try_extract_data(page, collected_data: list[list[str]], seen_snapshots: set,
+# Every table's rows as arrays of cell text, read in a single round-trip
+_READ_TABLES_JS = """() => Array.from(document.querySelectorAll("table"), table =>
+    Array.from(table.querySelectorAll("tr"), row =>
+        Array.from(row.querySelectorAll("th, td"), cell => cell.innerText.trim())))"""
+
+
+# Cheap novelty signature computed in the page, so the full HTML never
+# crosses the CDP socket just to decide whether a screenshot is worth taking
+_PAGE_SIGNATURE_JS = """() => [
+    document.documentElement.outerHTML.length,
+    document.title,
+    location.href,
+    document.body ? document.body.childElementCount : 0,
+].join(":")"""
+
+
+def try_extract_data(page, collected_data: "CsvWriter", seen_snapshots: set[int],
                      label: str | None = None):
     """Extract data from the current page: tables first, screenshot fallback.
 
     Tables are tagged with a page-context label (or an explicit label from the
     agent's ``extract`` command).  If no tables are found and the page content
-    has changed, a screenshot is saved instead.
+    has changed, a screenshot is saved instead. *seen_snapshots* holds 64-bit
+    fingerprints only, so it never keeps extracted rows alive.
     """
     ctx = detect_page_context(page)
     page_label = label or ctx["label"]
     source_url = ctx["url"]
 
-    tables = page.query_selector_all("table")
+    raw_tables = page.evaluate(_READ_TABLES_JS)
     extracted_any = False
 
-    for table in tables:
-        rows = table.query_selector_all("tr")
-        raw_rows = []
-        for row in rows:
-            cells = row.query_selector_all("th, td")
-            raw_rows.append([cell.inner_text().strip() for cell in cells])
-
+    for raw_rows in raw_tables:
         if len(raw_rows) < 2:
             continue
 
-        # Deduplicate by hashing header + first + last data rows (label-independent)
-        snapshot = f"{raw_rows[0]}:{raw_rows[1] if len(raw_rows) > 1 else ''}:{raw_rows[-1]}"
+        # Deduplicate by row count + header + first + last data rows (label-independent)
+        snapshot = hash((len(raw_rows), tuple(raw_rows[0]), tuple(raw_rows[1]), tuple(raw_rows[-1])))
         if snapshot in seen_snapshots:
             continue
         seen_snapshots.add(snapshot)
 
-        # Add header with Page / Source_URL columns on first collection
-        if not collected_data:
-            collected_data.append(["Page", "Source_URL"] + raw_rows[0])
-
-        # Add data rows (skip header row) with page label + URL prefix
-        for data_row in raw_rows[1:]:
-            collected_data.append([page_label, source_url] + data_row)
-
+        collected_data.write_table(page_label, source_url, raw_rows)
         extracted_any = True
         print(f"  Extracted {len(raw_rows) - 1} rows [{page_label}]")
 
     if not extracted_any:
         # Screenshot fallback — only if page content looks new
-        content_hash = hashlib.md5(page.content().encode()).hexdigest()
+        signature = page.evaluate(_PAGE_SIGNATURE_JS)
+        content_hash = int.from_bytes(
+            hashlib.blake2b(signature.encode(), digest_size=8).digest(), "big"
+        )
         if content_hash not in seen_snapshots:
             seen_snapshots.add(content_hash)
-            os.makedirs("./output", exist_ok=True)
-            safe_label = re.sub(r"[^A-Za-z0-9\-_]", "_", page_label)[:40]
-            screenshot_path = f"./output/snapshot_{safe_label}_{content_hash[:8]}.png"
+            os.makedirs(collected_data.output_dir, exist_ok=True)
+            safe_label = _FILENAME_UNSAFE_RE.sub("_", page_label)[:40]
+            screenshot_path = os.path.join(
+                collected_data.output_dir, f"snapshot_{safe_label}_{content_hash >> 32:08x}.png"
+            )
             page.screenshot(path=screenshot_path, full_page=True)
             print(f"  No tables found — screenshot saved: {screenshot_path}")
 
 
-def save_collected_data(collected_data: list[list[str]], output_dir: str = "./output") -> str | None:
-    """Save all collected table data to a single CSV."""
-    if not collected_data:
-        return None
-    os.makedirs(output_dir, exist_ok=True)
-    filename = os.path.join(output_dir, "collected_data.csv")
-    with open(filename, "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerows(collected_data)
-    print(f"  Saved {len(collected_data) - 1} total rows to {filename}")
+class CsvWriter:
+    """Streams extracted table rows to ``<output_dir>/collected_data.csv``.
+
+    The file is opened on the first table (so runs without tables leave no
+    CSV behind) and the header — ``Page``, ``Source_URL`` plus the first
+    table's columns — is written once. Rows are flushed after every table, so
+    memory stays flat and a crash keeps everything extracted so far.
+    """
+
+    def __init__(self, output_dir: str = "./output"):
+        self.output_dir = output_dir
+        self.filename = os.path.join(output_dir, "collected_data.csv")
+        self.rows_written = 0
+        self._file = None
+        self._writer = None
+
+    def write_table(self, page_label: str, source_url: str, raw_rows: list[list[str]]):
+        """Write a table's data rows (skipping its header) with label + URL prefix."""
+        if self._writer is None:
+            os.makedirs(self.output_dir, exist_ok=True)
+            self._file = open(self.filename, "w", newline="", encoding="utf-8", buffering=8192)
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(["Page", "Source_URL"] + raw_rows[0])
+        self._writer.writerows([page_label, source_url] + row for row in raw_rows[1:])
+        self._file.flush()
+        self.rows_written += len(raw_rows) - 1
+
+    def close(self) -> str | None:
+        """Close the CSV and return its path, or None if nothing was written."""
+        if self._file is None:
+            return None
+        if not self._file.closed:
+            self._file.close()
+        return self.filename
+
+
+def save_collected_data(collected_data: CsvWriter) -> str | None:
+    """Finish the streamed CSV of all collected table data."""
+    filename = collected_data.close()
+    if filename:
+        print(f"  Saved {collected_data.rows_written} total rows to {filename}")
     return filename
 
 
@@ -604,89 +1306,215 @@ def save_collected_data(collected_data: list[list[str]], output_dir: str = "./ou
 # Cookie consent
 # ---------------------------------------------------------------------------
 
-def dismiss_cookie_consent(page):
-    """Try to dismiss common cookie consent dialogs before the agent starts."""
-    consent_selectors = [
-        # Yahoo / Oath consent
-        "button[name='agree']",
-        "[data-testid='consent-accept']",
-        "button.consent-accept",
-        # Generic consent buttons (common patterns)
-        "button:has-text('Accept all')",
-        "button:has-text('Accept All')",
-        "button:has-text('Alle akzeptieren')",
-        "button:has-text('Akzeptieren')",
-        "button:has-text('Tout accepter')",
-        "button:has-text('Agree')",
-        "button:has-text('I agree')",
-        "button:has-text('OK')",
-        "button:has-text('Got it')",
-        # GDPR / CMP frameworks
-        ".cmp-revoke-consent button",
-        "#onetrust-accept-btn-handler",
-        ".cookie-consent-accept",
-        "[aria-label='Accept cookies']",
-        "[aria-label='Cookies akzeptieren']",
+# Consent buttons matched by CSS (Yahoo / Oath, GDPR / CMP frameworks)
+_CONSENT_CSS_SELECTORS = [
+    "button[name='agree']",
+    "[data-testid='consent-accept']",
+    "button.consent-accept",
+    ".cmp-revoke-consent button",
+    "#onetrust-accept-btn-handler",
+    ".cookie-consent-accept",
+    "[aria-label='Accept cookies']",
+    "[aria-label='Cookies akzeptieren']",
+]
+_CONSENT_CSS = ", ".join(_CONSENT_CSS_SELECTORS)
+# Consent buttons matched by their text, in priority order. Each pattern is
+# anchored to the start of the name on a word boundary, so "OK" matches
+# "OK, got it" but not "Cookie settings" or "Book".
+_CONSENT_TEXT_PATTERNS = [
+    re.compile(rf"^\s*{re.escape(text)}\b", re.IGNORECASE)
+    for text in (
+        "Accept all", "Alle akzeptieren", "Akzeptieren", "Tout accepter",
+        "I agree", "Agree", "OK", "Got it",
+    )
+]
+
+
+def _consent_locators(frame) -> list:
+    """Visible consent buttons in *frame*, one locator per pattern, best first.
+
+    Known CMP selectors come first, then the text patterns. Filtering on
+    visibility keeps hidden earlier matches (a closed modal's "OK") from
+    shadowing a visible button.
+    """
+    visible = frame.locator("*:visible")
+    return [frame.locator(_CONSENT_CSS).and_(visible)] + [
+        frame.get_by_role("button", name=pattern).and_(visible)
+        for pattern in _CONSENT_TEXT_PATTERNS
     ]
 
-    page.wait_for_timeout(2000)  # Let consent dialogs load
 
-    for selector in consent_selectors:
+def _click_consent(frame, timeout: int = 0) -> bool:
+    """Click the highest-priority visible consent button in *frame*, if any.
+
+    With a *timeout*, first waits that long (once, across all patterns) for
+    any consent button to appear.
+    """
+    locators = _consent_locators(frame)
+    if timeout:
+        any_button = locators[0]
+        for locator in locators[1:]:
+            any_button = any_button.or_(locator)
+        try:
+            any_button.first.wait_for(state="visible", timeout=timeout)
+        except Exception:
+            return False
+    for locator in locators:
+        if locator.count():
+            locator.first.click()
+            return True
+    return False
+
+
+def dismiss_cookie_consent(page):
+    """Try to dismiss common cookie consent dialogs before the agent starts.
+
+    The page is probed with one wait (up to 2s) for any known consent button,
+    then the best visible match is clicked. Consent iframes are then checked
+    without waiting.
+    """
+    try:
+        if _click_consent(page, timeout=2000):
+            print("  Dismissed cookie consent")
+            page.wait_for_timeout(1000)
+            return
+    except Exception:
+        pass
+
+    # Try iframe-based consent (some sites put it in an iframe)
+    for frame in page.frames[1:]:
         try:
-            btn = page.locator(selector).first
-            if btn.is_visible(timeout=500):
-                btn.click()
-                print(f"  Dismissed cookie consent via: {selector}")
+            if _click_consent(frame):
+                print(f"  Dismissed cookie consent in iframe: {frame.url}")
                 page.wait_for_timeout(1000)
                 return
         except Exception:
             continue
 
-    # Try iframe-based consent (some sites put it in an iframe)
-    for frame in page.frames:
-        for selector in consent_selectors:
-            try:
-                btn = frame.locator(selector).first
-                if btn.is_visible(timeout=300):
-                    btn.click()
-                    print(f"  Dismissed cookie consent in iframe via: {selector}")
-                    page.wait_for_timeout(1000)
-                    return
-            except Exception:
-                continue
-
 
 # ---------------------------------------------------------------------------
 # Model detection
 # ---------------------------------------------------------------------------
 
+# Served model name per API base, so warm starts skip the /models request
+_MODEL_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".cache", "browser_agent", "model_cache.json")
+_MODEL_CACHE_TTL = 3600  # Seconds; a restarted server may serve something else
+
+
+def _load_model_cache() -> dict:
+    try:
+        with open(_MODEL_CACHE_FILE, "rb") as f:
+            return _json_loads(f.read())
+    except Exception:
+        return {}
+
+
+def _save_model_cache(cache: dict):
+    try:
+        os.makedirs(os.path.dirname(_MODEL_CACHE_FILE), exist_ok=True)
+        with open(_MODEL_CACHE_FILE, "wb") as f:
+            f.write(_json_dumps(cache))
+    except Exception:
+        pass  # Caching is best-effort
+
+
 def detect_model_name() -> str:
-    """Query the vLLM server to get the served model name."""
+    """Return the served model name, from the on-disk cache or the vLLM server.
+
+    Also sets MODEL_ROOT to the model's path (vLLM's ``root`` field).
+    """
+    global MODEL_ROOT
+    cache = _load_model_cache()
+    entry = cache.get(API_BASE)
+    if entry and time.time() - entry.get("ts", 0) < _MODEL_CACHE_TTL:
+        print(f"  Using cached model name: {entry['id']}")
+        MODEL_ROOT = entry.get("root")
+        return entry["id"]
     try:
-        resp = requests.get(f"{API_BASE}/models", timeout=10)
+        resp = _SESSION.get(f"{API_BASE}/models", timeout=10)
         resp.raise_for_status()
-        models = resp.json().get("data", [])
+        models = _json_loads(resp.content).get("data", [])
         if models:
             name = models[0]["id"]
+            MODEL_ROOT = models[0].get("root")
             print(f"  Detected model: {name}")
+            cache[API_BASE] = {"id": name, "root": MODEL_ROOT, "ts": time.time()}
+            _save_model_cache(cache)
             return name
     except Exception as e:
         print(f"  Could not detect model name: {e}")
     return "qwen2.5-7b"
 
 
+def _refresh_model_name() -> bool:
+    """Drop the cached model name and ask the server again.
+
+    Returns True if MODEL_NAME changed, i.e. a 404 came from a stale id
+    rather than from a server without the endpoint.
+    """
+    global MODEL_NAME
+    cache = _load_model_cache()
+    if cache.pop(API_BASE, None) is not None:
+        _save_model_cache(cache)
+    name = detect_model_name()
+    if name == MODEL_NAME:
+        return False
+    MODEL_NAME = name
+    return True
+
+
 # ---------------------------------------------------------------------------
 # Auth setup functions — each returns (page, cleanup_fn)
 # ---------------------------------------------------------------------------
 
 def _ask(value, prompt, default=None):
-    """Return *value* if already set (from CLI), otherwise prompt interactively."""
+    """Return *value* if already set (from CLI), otherwise prompt interactively.
+
+    With piped stdin, questions that have a default take it without reading,
+    so the pipe is left for the task text.
+    """
     if value is not None:
         return value
+    if default is not None and not sys.stdin.isatty():
+        return default
     raw = input(prompt).strip()
     return raw if raw else default
 
 
+_browser = None
+
+
+def _get_browser(pw):
+    """Return the shared Chromium instance, launching it on first use.
+
+    Setups hand out a fresh context per task and close only that context, so
+    later setups in the same process skip the browser cold start.
+    """
+    global _browser
+    if _browser is None or not _browser.is_connected():
+        _browser = pw.chromium.launch(headless=False)
+    return _browser
+
+
+_VIEWPORT = {"width": 1280, "height": 900}
+
+# Images, fonts and media the tree-based agent never looks at. Matching on the
+# URL (rather than routing "**/*" and checking resource_type) keeps every
+# other request off the Python route handler.
+_HEAVY_RESOURCE_RE = re.compile(
+    r"\.(?:png|jpe?g|gif|webp|avif|svg|ico|bmp|woff2?|ttf|otf|eot|mp4|webm|ogg|mp3|wav|m4a)(?:[?#]|$)",
+    re.IGNORECASE,
+)
+
+
+def _new_context(pw, args):
+    """Open a context on the shared browser, blocking heavy resources unless --load-media."""
+    context = _get_browser(pw).new_context(viewport=_VIEWPORT)
+    if not args.load_media:
+        context.route(_HEAVY_RESOURCE_RE, lambda route: route.abort())
+    return context
+
+
 def setup_no_auth(pw, args):
     """Launch browser and navigate to a user-specified URL (no auth)."""
     start_url = _ask(
@@ -696,12 +1524,12 @@ def setup_no_auth(pw, args):
     )
 
     print(f"\nLaunching browser and navigating to {start_url} ...")
-    browser = pw.chromium.launch(headless=False)
-    page = browser.new_page()
+    context = _new_context(pw, args)
+    page = context.new_page()
     page.goto(start_url, wait_until="domcontentloaded")
     dismiss_cookie_consent(page)
 
-    return page, browser.close
+    return page, context.close
 
 
 def setup_credentials_auth(pw, args):
@@ -731,8 +1559,8 @@ def setup_credentials_auth(pw, args):
     )
 
     print(f"\nLaunching browser and navigating to {login_url} ...")
-    browser = pw.chromium.launch(headless=False)
-    page = browser.new_page()
+    context = _new_context(pw, args)
+    page = context.new_page()
     page.goto(login_url, wait_until="domcontentloaded")
     dismiss_cookie_consent(page)
 
@@ -745,7 +1573,7 @@ def setup_credentials_auth(pw, args):
     print("Login submitted. Waiting for page to settle ...")
     page.wait_for_timeout(2000)
 
-    return page, browser.close
+    return page, context.close
 
 
 def setup_token_auth(pw, args):
@@ -776,8 +1604,7 @@ def setup_token_auth(pw, args):
     domain = parsed.hostname
 
     print(f"\nLaunching browser and navigating to {target_url} ...")
-    browser = pw.chromium.launch(headless=False)
-    context = browser.new_context()
+    context = _new_context(pw, args)
 
     if token_type == "cookie":
         cookie_name = _ask(args.cookie_name, "Cookie name [default: session]: ", "session")
@@ -797,9 +1624,9 @@ def setup_token_auth(pw, args):
     page = context.new_page()
     page.goto(target_url, wait_until="domcontentloaded")
     dismiss_cookie_consent(page)
-    page.wait_for_timeout(1000)
+    _adaptive_wait(page, budget_ms=1000)
 
-    return page, browser.close
+    return page, context.close
 
 
 def setup_session_takeover(pw, args):
@@ -816,7 +1643,7 @@ def setup_session_takeover(pw, args):
     context = pw.chromium.launch_persistent_context(
         user_data_dir,
         headless=False,
-        viewport={"width": 1280, "height": 900},
+        viewport=_VIEWPORT,
     )
     page = context.pages[0] if context.pages else context.new_page()
 
@@ -835,6 +1662,8 @@ def setup_session_takeover(pw, args):
 
 def _read_multiline_task() -> str:
     """Read a multi-line task from stdin. Enter a blank line or Ctrl-D to finish."""
+    if not sys.stdin.isatty():
+        return sys.stdin.read().strip()  # Piped task: take it all in one read
     print("\nEnter the task / instruction for the agent (blank line to finish):")
     lines = []
     while True:
@@ -848,6 +1677,30 @@ def _read_multiline_task() -> str:
     return "\n".join(lines).strip()
 
 
+_MAX_REPLAYS = 32
+
+
+def _submit_daemon(fn, *args, **kwargs) -> Future:
+    """Run fn(*args, **kwargs) on a daemon thread and return its Future.
+
+    send_prompt is plain HTTP, so it can run off-thread while the main thread
+    (which owns the thread-affine Playwright page) does the per-step
+    extraction. A daemon thread is not joined at exit, so Ctrl-C never waits
+    for a request still in flight, whether it is waiting on the server or
+    streaming.
+    """
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
 def run_agent(page, cleanup_fn, args):
     """Run the agent loop on an already-authenticated page."""
     task = args.task if args.task else _read_multiline_task()
@@ -859,15 +1712,24 @@ def run_agent(page, cleanup_fn, args):
 
     history_action = "\n"
     history_info = "\n"
-    collected_data = []
+    collected_data = CsvWriter(args.output_dir)
     seen_snapshots = set()
     last_command = ""
     repeat_count = 0
+    observation = None
+    tree_dirty = True
+    # (observation hash, hint, previous command) -> response. A hit means the
+    # last action left the page exactly as the model last saw it after that
+    # same action, so at temperature 0 the answer is replayed, not re-asked.
+    replies = OrderedDict()
 
     for step in range(1, MAX_STEPS + 1):
         try:
-            # Get accessibility tree as observation
-            observation = get_accessibility_tree(page)
+            # Get accessibility tree as observation, unless the last action
+            # could not have changed the page
+            if tree_dirty or observation is None:
+                observation = get_accessibility_tree(page)
+            tree_dirty = True
 
             # Loop detection: if the same command repeated 3+ times, inject a hint
             loop_hint = ""
@@ -881,9 +1743,28 @@ def run_agent(page, cleanup_fn, args):
                 print(f"  [Loop detected: '{last_command}' repeated {repeat_count}x, injecting hint]")
 
             print(f"\n--- Step {step} ---")
-            response = send_prompt(
-                task + loop_hint, observation, history_action, history_info
-            )
+            reply_key = (hash(observation), loop_hint, last_command)
+            response = replies.get(reply_key) if last_command else None
+            pending = None
+            if response is None:
+                pending = _submit_daemon(
+                    send_prompt, task, observation, history_action, history_info,
+                    hint=loop_hint,
+                )
+            else:
+                print("  [Page unchanged by repeated action — replaying cached response]")
+
+            # Automatic extraction as safety net, overlapped with generation
+            try:
+                try_extract_data(page, collected_data, seen_snapshots)
+            except Exception:
+                pass  # Page may have navigated; extraction is best-effort
+
+            if pending is not None:
+                response = pending.result()
+                replies[reply_key] = response
+                if len(replies) > _MAX_REPLAYS:
+                    replies.popitem(last=False)
 
             # Extract command and conclusion
             command = extract_command(response)
@@ -906,9 +1787,11 @@ def run_agent(page, cleanup_fn, args):
 
             # Update history
             history_action += command + "\n"
-            history_info += conclusion + "\n"
+            if conclusion:
+                history_info += conclusion + "\n"
 
-            if not execute_action(page, command, collected_data, seen_snapshots):
+            keep_going, tree_dirty = execute_action(page, command, collected_data, seen_snapshots)
+            if not keep_going:
                 break
 
         except Exception as e:
@@ -923,13 +1806,9 @@ def run_agent(page, cleanup_fn, args):
                 except Exception:
                     pass
 
-        # Automatic per-step extraction as safety net
-        try:
-            try_extract_data(page, collected_data, seen_snapshots)
-        except Exception:
-            pass  # Page may have navigated; extraction is best-effort
-
-        page.wait_for_timeout(1500)
+        # Nothing to settle after actions that cannot have changed the page
+        if tree_dirty:
+            _adaptive_wait(page)
 
     # Final extraction attempt on the last page
     try:
@@ -944,8 +1823,8 @@ def run_agent(page, cleanup_fn, args):
         print(f"\nAll data saved to {saved}")
     else:
         # Take a screenshot as final fallback
-        screenshot_path = "./output/final_page.png"
-        os.makedirs("./output", exist_ok=True)
+        screenshot_path = os.path.join(args.output_dir, "final_page.png")
+        os.makedirs(args.output_dir, exist_ok=True)
         page.screenshot(path=screenshot_path, full_page=True)
         print(f"No tables found. Screenshot saved to {screenshot_path}")
 
@@ -981,6 +1860,20 @@ examples:
                    help="Auth mode: 1=none, 2=credentials, 3=token, 4=session")
     p.add_argument("--url", default=None, help="Starting / login / target URL")
     p.add_argument("--task", default=None, help="Task instruction for the agent")
+    p.add_argument("--observation", default="axtree", choices=["axtree", "domsnapshot"],
+                   help="Observation source: full accessibility tree (default) or "
+                        "a lighter DOMSnapshot-derived tree")
+    p.add_argument("--output-dir", default="./output",
+                   help="Where CSV data and screenshots are written (default: ./output); "
+                        "give each concurrent run its own")
+    p.add_argument("--compress-requests", action="store_true",
+                   help="Gzip prompt bodies sent to the model server (needs a server "
+                        "or proxy that accepts Content-Encoding: gzip)")
+    p.add_argument("--load-media", action="store_true",
+                   help="Load images, fonts and media (blocked by default in modes 1-3)")
+    p.add_argument("--script-action", action="store_true",
+                   help="Tell the model about the multi-action `script` command "
+                        "(off by default to keep the stock system prompt)")
 
     # Credentials auth (mode 2)
     p.add_argument("--username", default=None, help="Login username (mode 2)")
@@ -1007,11 +1900,16 @@ examples:
 
 
 def main():
-    global API_BASE, MODEL_NAME
+    global API_BASE, MODEL_NAME, OBSERVATION_MODE, COMPRESS_REQUESTS, _PROMPT_PREFIX
     args = build_parser().parse_args()
+    OBSERVATION_MODE = args.observation
+    COMPRESS_REQUESTS = args.compress_requests
+    if args.script_action:
+        _PROMPT_PREFIX = SYSTEM_PROMPT + "\n\n" + SCRIPT_ACTION_DOC + "\n\n"
 
     port = _ask(args.port, "Enter the model server port [default: 5001]: ", "5001")
     API_BASE = f"http://localhost:{port}/v1"
+    _SESSION.mount(API_BASE, HTTPAdapter(pool_connections=1, pool_maxsize=4))
 
     print("Connecting to model server ...")
     MODEL_NAME = detect_model_name()
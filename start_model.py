@@ -2,6 +2,7 @@
 """Start a vLLM OpenAI-compatible API server for the Tiger Browser-Agent model."""
 
 import argparse
+import json
 import os
 import re
 import subprocess
@@ -37,6 +38,9 @@ def main():
     parser = argparse.ArgumentParser(description="Start vLLM model server")
     parser.add_argument("--model", help="Local model path or HuggingFace model ID")
     parser.add_argument("--port", help="Port to serve on")
+    parser.add_argument("--draft-model",
+                        help="Small model with the same tokenizer for speculative decoding "
+                             "(e.g. Qwen/Qwen2.5-0.5B-Instruct); off by default")
     args = parser.parse_args()
 
     model_path = args.model or input(
@@ -61,9 +65,21 @@ def main():
         "--served-model-name", "qwen2.5-7b",
         "--max-model-len", "32768",
         "--gpu-memory-utilization", "0.9",
+        # The agent resends the same system prompt + objective every step;
+        # reuse their KV instead of re-prefilling them
+        "--enable-prefix-caching",
+        # Split long prompts (big accessibility trees) into chunks that share
+        # batches with decoding instead of stalling it
+        "--enable-chunked-prefill",
+        "--max-num-batched-tokens", "8192",
         "--trust-remote-code",
         "--disable-log-requests",
     ]
+    if args.draft_model:
+        cmd += ["--speculative-config", json.dumps({
+            "model": resolve_model_path(args.draft_model),
+            "num_speculative_tokens": 5,
+        })]
 
     try:
         subprocess.run(cmd, check=True)